@@ -0,0 +1,69 @@
+import numpy as np
+from numba import njit
+
+# Range of tempos which are considered during the estimation.
+MIN_BPM = 30.0
+MAX_BPM = 300.0
+# Tempos close to this value are preferred, to avoid picking half or double the tempo.
+START_BPM = 120.0
+
+# Not parallel, the files are already analysed in parallel worker processes.
+@njit(cache=True, fastmath=True)
+def _beat_period(env: np.ndarray, sr: int, hop: int) -> float:
+    """
+    Find the beat period of an onset strength envelope.
+    The envelope is autocorrelated over all lags within the tempo range, each lag weighted by a
+    log-normal prior around START_BPM. The best lag is refined with a parabolic interpolation.
+
+    Args:
+        env (np.ndarray): The onset strength envelope.
+        sr (int): The sample rate of the audio the envelope was computed from.
+        hop (int): The number of samples between two envelope frames.
+    Returns:
+        float: The beat period in envelope frames, or -1.0 when the envelope is too short.
+    """
+    n = env.shape[0]
+    frame_rate = sr / hop
+    min_lag = max(1, int(frame_rate * 60.0 / MAX_BPM))
+    max_lag = min(n - 2, int(frame_rate * 60.0 / MIN_BPM))
+    if max_lag <= min_lag:
+        return -1.0
+
+    centered = env - env.mean()
+    score = np.zeros(max_lag + 2)
+    for lag in range(min_lag, max_lag + 2):
+        acc = 0.0
+        for i in range(n - lag):
+            acc += centered[i] * centered[i + lag]
+        weight = np.exp(-0.5 * np.log2(60.0 * frame_rate / (lag * START_BPM)) ** 2)
+        score[lag] = weight * acc / (n - lag)
+
+    best = min_lag
+    for lag in range(min_lag + 1, max_lag + 1):
+        if score[lag] > score[best]:
+            best = lag
+
+    offset = 0.0
+    if best > min_lag:
+        left = score[best - 1]
+        right = score[best + 1]
+        denom = left - 2.0 * score[best] + right
+        if denom != 0.0:
+            offset = min(0.5, max(-0.5, 0.5 * (left - right) / denom))
+    return best + offset
+
+def estimate_bpm(onset_env: np.ndarray, sr: int, hop_length: int) -> float:
+    """
+    Estimate the BPM from an onset strength envelope.
+
+    Args:
+        onset_env (np.ndarray): The onset strength envelope.
+        sr (int): The sample rate of the audio the envelope was computed from.
+        hop_length (int): The number of samples between two envelope frames.
+    Returns:
+        float: The estimated BPM value, or -1.0 when no tempo could be found.
+    """
+    period = _beat_period(np.ascontiguousarray(onset_env, dtype=np.float64), sr, hop_length)
+    if period <= 0.0:
+        return -1.0
+    return 60.0 * sr / (hop_length * period)
@@ -1,15 +1,76 @@
 import os
-import librosa
 import argparse
-from mutagen.mp3 import MP3
+from typing import TYPE_CHECKING
+from concurrent.futures import ProcessPoolExecutor
 from mutagen.mp4 import MP4
 from mutagen.id3 import ID3, TBPM
 
 import common as cm
 
+if TYPE_CHECKING:
+    import numpy as np
+
+# Beat tracking only needs the onset envelope, which is accurate enough at a quarter of the CD sample rate.
+BPM_SAMPLE_RATE = 11025
+HOP_LENGTH = 512
+# Number of envelope frames decoded at once when streaming a file, about 2^18 samples.
+STREAM_BLOCK_LENGTH = 128
+
+def _onset_envelope(audio_path: str) -> tuple["np.ndarray", int, int]:
+    """
+    Compute the onset strength envelope of the audio file.
+    Files which soundfile can decode are streamed block by block, so only one block is held in memory.
+    Streamed files keep their native sample rate and are not resampled,
+    the hop length is scaled to keep the same time resolution. Stereo blocks are downmixed to mono.
+    All other files (e.g. m4a) are loaded completely, resampled to BPM_SAMPLE_RATE.
+
+    Args:
+        audio_path (str): The path to the audio file.
+    Returns:
+        tuple[np.ndarray, int, int]: The onset strength envelope, the sample rate and the hop length it was computed with.
+    """
+    # Imported lazily, so worker processes start fast and files with a BPM value never load librosa.
+    import numpy as np
+    import librosa
+    import soundfile as sf
+
+    try:
+        info = sf.info(audio_path)
+    except RuntimeError:
+        y, sr = librosa.load(audio_path, sr=BPM_SAMPLE_RATE, mono=True, res_type="soxr_qq")
+        return librosa.onset.onset_strength(y=y, sr=sr, hop_length=HOP_LENGTH), sr, HOP_LENGTH
+
+    sr = info.samplerate
+    hop_length = HOP_LENGTH * max(1, round(sr / BPM_SAMPLE_RATE))
+    frame_length = 4 * hop_length
+    # The spectrogram is computed without centering, so no block is zero padded and every frame lies completely
+    # in one block. Consecutive blocks overlap by one frame, the first frame of a block is the last of the previous
+    # one and only serves as reference for the spectral difference at the block boundary.
+    blocks = sf.blocks(audio_path,
+                       blocksize=frame_length + STREAM_BLOCK_LENGTH * hop_length,
+                       overlap=frame_length,
+                       fill_value=0,
+                       dtype="float32",
+                       always_2d=False)
+    envelopes = []
+    for block in blocks:
+        if block.ndim == 2:
+            block = block.mean(axis=1, dtype=np.float32)
+        mel = librosa.feature.melspectrogram(
+            y=block, sr=sr, n_fft=frame_length, hop_length=hop_length, center=False, fmax=0.5 * sr)
+        # Without top_db the decibel values do not depend on the loudest frame of the block.
+        env = librosa.onset.onset_strength(
+            S=librosa.power_to_db(mel, top_db=None), sr=sr, hop_length=hop_length, n_fft=frame_length, center=False)
+        # The first value is padding for the frame before the block, only the first block has no such frame.
+        envelopes.append(env[1:] if envelopes else env)
+    # The last block is filled up with silence, only the frames within the file are kept.
+    n_frames = max(0, 1 + (info.frames - frame_length) // hop_length)
+    return np.concatenate(envelopes)[:n_frames], sr, hop_length
+
 def find_bpm(audio_path: str) -> float:
     """
-    Estimate BPM of the given audio file, using librosa.
+    Estimate BPM of the given audio file.
+    The onset envelope is computed with librosa, the tempo is estimated from it with beat.estimate_bpm.
     
     Args:
         audio_path (str): The path to the file, to find the BPM for.
@@ -19,13 +80,18 @@ def find_bpm(audio_path: str) -> float:
     """
     if cm.get_audio_file_extension(audio_path) == cm.AudioFileExtension.NOT_SUPPORTED:
         return -1.0
-    
+
+    # Imported lazily as well, numba compiles or loads the estimator on import.
+    import beat
+
     try:
-        y, sr = librosa.load(audio_path)
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        if len(tempo) > 0 and tempo[0] > 0.0:
-            cm.log(cm.LogLevel.SUCCESS, f"Found BPM: {tempo[0]}")
-            return tempo[0]
+        # Only the tempo is needed, so the beat positions of beat_track are skipped.
+        onset_env, sr, hop_length = _onset_envelope(audio_path)
+        tempo = beat.estimate_bpm(onset_env, sr, hop_length)
+        if tempo > 0.0:
+            if cm.log_enabled(cm.LogLevel.SUCCESS):
+                cm.log(cm.LogLevel.SUCCESS, f"Found BPM: {tempo}")
+            return tempo
         else:
             cm.log(cm.LogLevel.WARN, f"Invalid BPM {tempo} returned.")
             return -1.0
@@ -34,48 +100,86 @@ def find_bpm(audio_path: str) -> float:
         cm.log(cm.LogLevel.WARN, f"An error occurred during BPM estimation.")
         return -1.0
 
-def has_bpm(audio_path: str) -> bool:
+def _has_bpm_mp3(audio: ID3) -> bool:
+    bpm_tag = audio.get("TBPM")
+    if bpm_tag and bpm_tag.text:
+        try:
+            bpm = int(bpm_tag.text[0])
+            return bpm > 0
+        except (ValueError, TypeError):
+            if cm.log_enabled(cm.LogLevel.INFO):
+                cm.log(cm.LogLevel.INFO, f"The first value in the mp3 tag \"TBPM\" is not an numerical value: {bpm_tag.text[0]}.")
+            return False
+    else:
+        cm.log(cm.LogLevel.FINE, f"No bpm value found.")
+        return False
+
+def _has_bpm_m4a(audio: MP4) -> bool:
+    bpm_list = audio.tags.get("tmpo") if audio.tags else None
+    if bpm_list and len(bpm_list) > 0:
+        try:
+            bpm = int(bpm_list[0])
+            return bpm > 0
+        except (ValueError, TypeError):
+            if cm.log_enabled(cm.LogLevel.INFO):
+                cm.log(cm.LogLevel.INFO, f"The first value in the m4a tag \"tmpo\" is not a numerical value: {bpm_list[0]}.")
+            return False
+    else:
+        cm.log(cm.LogLevel.FINE, f"No bpm value found for.")
+        return False
+
+def _set_bpm_mp3(audio: ID3, bpm_value: int):
+    if "TBPM" in audio:
+        # Delete all old existing TBPM tags in file.
+        audio.delall("TBPM")
+    audio.add(TBPM(encoding=3, text=str(bpm_value)))
+
+def _set_bpm_m4a(audio: MP4, bpm_value: int):
+    if audio.tags is None:
+        audio.add_tags()
+    audio["tmpo"] = [bpm_value]
+
+_HAS_BPM = {
+    cm.AudioFileExtension.MP3: _has_bpm_mp3,
+    cm.AudioFileExtension.M4A: _has_bpm_m4a,
+}
+_SET_BPM = {
+    cm.AudioFileExtension.MP3: _set_bpm_mp3,
+    cm.AudioFileExtension.M4A: _set_bpm_m4a,
+}
+
+def _bpm_in_tags(ext: cm.AudioFileExtension, audio: ID3 | MP4) -> bool:
+    """
+    Check if the already opened audio file has a BPM value defined.
+
+    Args:
+        ext (AudioFileExtension): The enum type of the file extension.
+        audio (ID3 | MP4): The opened audio file.
+    Returns:
+        bool: True if the file has a BPM value, False otherwise.
+    """
+    has_bpm_of_format = _HAS_BPM.get(ext)
+    return has_bpm_of_format is not None and has_bpm_of_format(audio)
+
+def has_bpm(audio_path: str, audio: ID3 | MP4=None) -> bool:
     """
     Check if the audio file already has a BPM value defined.
 
     Args:
         audio_path (str): The path to the file, to check if the BPM value is already present.
+        audio (ID3 | MP4, optional): The already opened audio file. If not set the file will be opened.
     Returns:
         bool: True if the file has a BPM value, False otherwise.
     """
-    ext = cm.get_audio_file_extension(audio_path)
-
-    match ext:
-        case cm.AudioFileExtension.NOT_SUPPORTED:
+    if audio is None:
+        ext, audio = cm.open_audio(audio_path)
+        if audio is None:
             return False
-        case cm.AudioFileExtension.MP3:
-            audio = MP3(audio_path, ID3=ID3)
-            bpm_tag = audio.tags.get("TBPM")
-            if bpm_tag and bpm_tag.text:
-                try:
-                    bpm = int(bpm_tag.text[0])
-                    return bpm > 0
-                except (ValueError, TypeError):
-                    cm.log(cm.LogLevel.INFO, f"The first value in the mp3 tag \"TBPM\" is not an numerical value: {bpm_tag.text[0]}.")
-                    return False
-            else:
-                cm.log(cm.LogLevel.FINE, f"No bpm value found.")
-                return False
-        case cm.AudioFileExtension.M4A:
-            audio = MP4(audio_path)
-            bpm_list = audio.tags.get("tmpo")
-            if bpm_list and len(bpm_list) > 0:
-                try:
-                    bpm = int(bpm_list[0])
-                    return bpm > 0
-                except (ValueError, TypeError):
-                    cm.log(cm.LogLevel.INFO, f"The first value in the m4a tag \"tmpo\" is not a numerical value: {bpm_list[0]}.")
-                    return False
-            else:
-                cm.log(cm.LogLevel.FINE, f"No bpm value found for.")
-                return False
+    else:
+        ext = cm.get_audio_file_extension(audio_path)
+    return _bpm_in_tags(ext, audio)
     
-def add_bpm(audio_path: str):
+def add_bpm(audio_path: str, audio: ID3 | MP4=None):
     """
     Adds the bpm to the metadata of the audio file.
     - First checks if a bpm value is already present in the audio file.
@@ -83,8 +187,18 @@ def add_bpm(audio_path: str):
 
     Args:
         audio_path (str): The path to the file, to add the BPM value (if not present).
+        audio (ID3 | MP4, optional): The already opened audio file. If set the BPM value is only added to its tags,
+        saving the file is then up to the caller.
     """
-    if has_bpm(audio_path):
+    save = audio is None
+    if audio is None:
+        ext, audio = cm.open_audio(audio_path)
+        if audio is None:
+            return
+    else:
+        ext = cm.get_audio_file_extension(audio_path)
+
+    if _bpm_in_tags(ext, audio):
         cm.log(cm.LogLevel.FINE, f"Has already a BPM value.")
         return
 
@@ -92,33 +206,23 @@ def add_bpm(audio_path: str):
     if bpm <= 0.0:
         return # Unsuccessful finding bpm for audio
 
-    ext = cm.get_audio_file_extension(audio_path)
     bpm_value = int(round(bpm))
 
-    match ext:
-        case cm.AudioFileExtension.NOT_SUPPORTED:
-            return
-        case cm.AudioFileExtension.MP3:
-            audio = MP3(audio_path, ID3=ID3)
-            if audio.tags is None:
-                audio.add_tags()
-            if "TBPM" in audio.tags:
-                # Delete all old existing TBPM tags in file.
-                audio.tags.delall("TBPM")
-            audio.tags.add(TBPM(encoding=3, text=str(bpm_value)))
-            audio.save(v2_version=3)
-        case cm.AudioFileExtension.M4A:
-            audio = MP4(audio_path)
-            if audio.tags is None:
-                audio.add_tags()
-            audio["tmpo"] = [bpm_value]
-            audio.save()
-
-    cm.log(cm.LogLevel.SUCCESS, f"Successfully added BPM to {audio_path}.")
+    _SET_BPM[ext](audio, bpm_value)
+
+    if save:
+        cm.save_audio(audio)
+    if cm.log_enabled(cm.LogLevel.SUCCESS):
+        cm.log(cm.LogLevel.SUCCESS, f"Successfully added BPM to {audio_path}.")
+
+def _init_worker():
+    # The files are already analysed in parallel, avoid oversubscribing the cores with librosa's threads.
+    os.environ["OMP_NUM_THREADS"] = "1"
 
 def add_bpm_all(dir_path: str):
     """
     Adds the bpm to all supported audio files from the given directory recursively.
+    The files are analysed in parallel, one worker process per CPU core.
 
     Args:
         dir_path (str): The path to the base directory.
@@ -126,10 +230,24 @@ def add_bpm_all(dir_path: str):
     if not cm.valid_dir_path(dir_path):
         return
 
-    for root, _, files in os.walk(dir_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            add_bpm(file_path)
+    audio_paths = []
+    with cm.Manifest(read_only=True) as manifest:
+        for file_path in cm.iter_audio_files(dir_path):
+            if manifest.is_complete(file_path):
+                continue
+            # Files which already have a BPM value are never handed to librosa.
+            ext, audio = cm.open_audio(file_path, validate=False)
+            if audio is not None and not _bpm_in_tags(ext, audio):
+                audio_paths.append(file_path)
+
+    if not audio_paths:
+        cm.log(cm.LogLevel.INFO, f"No audio files without BPM found in {dir_path}")
+        return
+    cm.log(cm.LogLevel.INFO, f"{len(audio_paths)} audio files without BPM found in {dir_path}")
+
+    # Each path is handed to exactly one worker, so no file is written by two processes.
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_worker) as executor:
+        list(executor.map(add_bpm, audio_paths, chunksize=4))
 
 
 if __name__ == "__main__":
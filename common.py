@@ -1,5 +1,11 @@
 import os
+import dbm
 import shutil
+import shelve
+import functools
+from collections.abc import Iterator
+from mutagen.mp4 import MP4, MP4Tags
+from mutagen.id3 import ID3, ID3NoHeaderError
 from enum import Enum
 
 class AudioFileExtension(Enum):
@@ -7,6 +13,11 @@ class AudioFileExtension(Enum):
     MP3 = 1
     M4A = 2
 
+_AUDIO_FILE_EXTENSIONS = {
+    ".mp3": AudioFileExtension.MP3,
+    ".m4a": AudioFileExtension.M4A,
+}
+
 def valid_dir_path(dir_path: str) -> bool:
     """
     Checks if path exists. And the path points to a directory.
@@ -34,73 +45,265 @@ def valid_file_path(file_path: str) -> bool:
     Returns:
         bool: True when the file path is valid.
     """
+    if os.path.isfile(file_path):
+        return True
+
     if not os.path.exists(file_path):
         log(LogLevel.ERROR, f"Does not exists: {file_path}")
-        return False
-    elif not os.path.isfile(file_path):
+    else:
         log(LogLevel.ERROR, f"Not a file: {file_path}.")
-        return False
+    return False
 
-    return True
+@functools.lru_cache(maxsize=8192)
+def split_extension(file_path: str) -> tuple[str, str]:
+    """
+    Split the file path into the path without extension and the lowercase extension.
+    The result is cached, since the same path is classified several times per run.
 
-def get_audio_file_extension(file_path: str) -> AudioFileExtension:
+    Args:
+        file_path (str): The file path to split.
+    Returns:
+        tuple[str, str]: The path without extension and the lowercase extension, e.g. ("song", ".mp3").
+    """
+    base, ext = os.path.splitext(file_path)
+    return base, ext.lower()
+
+def _classify_ext(file_path: str) -> AudioFileExtension:
+    return _AUDIO_FILE_EXTENSIONS.get(split_extension(file_path)[1], AudioFileExtension.NOT_SUPPORTED)
+
+@functools.lru_cache(maxsize=8192)
+def get_audio_file_extension(file_path: str, validate: bool=True) -> AudioFileExtension:
     """
     Get the file extension of a file.
+    The result is cached per path, use get_audio_file_extension.cache_clear() to reset it.
     
     Args:
         file_path (str): The file path to get the extension from.
+        validate (bool, optional): If set the path is checked to be an existing file. Can be disabled for paths,
+        which are already known to be files, e.g. from iter_audio_files. Default is True.
     Returns:
         FileExtension: The enum type of the file extension.
     """
-    if not valid_file_path(file_path):
+    if validate and not valid_file_path(file_path):
         return AudioFileExtension.NOT_SUPPORTED
 
-    ext = os.path.splitext(file_path)[1].lower()
-    match ext:
-        case ".mp3":
-            return AudioFileExtension.MP3
-        case ".m4a":
-            return AudioFileExtension.M4A
-        case _:
-            log(LogLevel.WARN, f"File is not supported: {file_path}")
-            return AudioFileExtension.NOT_SUPPORTED
+    ext = _classify_ext(file_path)
+    if ext == AudioFileExtension.NOT_SUPPORTED:
+        log(LogLevel.WARN, f"File is not supported: {file_path}")
+    return ext
+
+def iter_audio_files(dir_path: str, recursive: bool=True) -> Iterator[str]:
+    """
+    Iterate over all supported audio files in the directory.
+    The file type is taken from the directory listing, so no extra stat call per file is needed.
+
+    Args:
+        dir_path (str): The path to the base directory.
+        recursive (bool, optional): If set the subdirectories are included. Default is True.
+    Returns:
+        Iterator[str]: The paths to the supported audio files. Directories which cannot be listed are skipped.
+    """
+    try:
+        entries = os.scandir(dir_path)
+    except OSError as e:
+        # Like os.walk, directories which cannot be listed are skipped instead of aborting the whole walk.
+        log(LogLevel.WARN, f"Skipped the directory {dir_path}: {e.strerror}.")
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    yield from iter_audio_files(entry.path)
+            elif entry.is_file() and _classify_ext(entry.name) != AudioFileExtension.NOT_SUPPORTED:
+                yield entry.path
+
+def _open_mp3(file_path: str) -> ID3:
+    # Only the tags are needed, reading them directly skips scanning the MPEG frames.
+    try:
+        return ID3(file_path)
+    except ID3NoHeaderError:
+        tags = ID3()
+        tags.filename = file_path
+        return tags
+
+_AUDIO_OPENERS = {
+    AudioFileExtension.MP3: _open_mp3,
+    AudioFileExtension.M4A: MP4,
+}
+
+def open_audio(file_path: str, validate: bool=True) -> tuple[AudioFileExtension, ID3 | MP4 | None]:
+    """
+    Open the audio file with mutagen, so the tags only need to be parsed once per file.
+
+    Args:
+        file_path (str): The file path of the audio file to open.
+        validate (bool, optional): If set the path is checked to be an existing file. Default is True.
+    Returns:
+        tuple[AudioFileExtension, ID3 | MP4 | None]: The enum type of the file extension and the opened audio file.
+        For mp3 files only the ID3 tags are opened. The audio file is None when the file is not supported.
+    """
+    ext = get_audio_file_extension(file_path, validate)
+    open_format = _AUDIO_OPENERS.get(ext)
+    if open_format is None:
+        return ext, None
+    return ext, open_format(file_path)
+
+def save_audio(audio: ID3 | MP4):
+    """
+    Write the tags of the opened audio file back to disk.
+    MP3 files are saved with ID3v2.3 tags, for compatibility with older players.
+
+    Args:
+        audio (ID3 | MP4): The opened audio file.
+    """
+    if isinstance(audio, ID3):
+        audio.save(v2_version=3)
+    else:
+        audio.save()
+
+def get_tags(audio: ID3 | MP4) -> ID3 | MP4Tags | None:
+    """
+    Get the tags of the opened audio file.
+
+    Args:
+        audio (ID3 | MP4): The opened audio file. For mp3 files these are the ID3 tags themselves.
+    Returns:
+        ID3 | MP4Tags | None: The tags of the audio file. None if the m4a file has no tags yet.
+    """
+    return audio if isinstance(audio, ID3) else audio.tags
 
+# The manifest is stored in the working directory, shelve might add a file extension depending on the platform.
+MANIFEST_PATH = ".audio_meta_cache"
 
-def move_file(source_path: str, dest_path: str):
+class Manifest:
+    """
+    Persistent record of audio files, which already have all metadata.
+    Later runs use it to skip these files without opening them.
+    Entries are keyed on the path, modification time and size, so a changed file is processed again.
+    """
+    def __init__(self, manifest_path: str=MANIFEST_PATH, sync_every: int=32, read_only: bool=False):
+        """
+        Args:
+            manifest_path (str, optional): The path to the manifest file. Default is MANIFEST_PATH.
+            sync_every (int, optional): The number of new entries after which the manifest is written to disk.
+            read_only (bool, optional): If set the manifest is only read, a missing manifest file is not created.
+            No file is complete then. Default is False.
+        """
+        try:
+            self._shelf = shelve.open(manifest_path, flag="r" if read_only else "c")
+        except dbm.error:
+            if not read_only:
+                raise
+            self._shelf = None
+        self._sync_every = sync_every
+        self._unsynced = 0
+
+    def __enter__(self) -> "Manifest":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _key(file_path: str) -> str | None:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return f"{os.path.abspath(file_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def is_complete(self, file_path: str) -> bool:
+        """
+        Check if the file was recorded as complete and has not changed since.
+
+        Args:
+            file_path (str): The path to the audio file.
+        Returns:
+            bool: True if the file has all metadata.
+        """
+        if self._shelf is None:
+            return False
+        key = self._key(file_path)
+        return key is not None and self._shelf.get(key, False)
+
+    def mark_complete(self, file_path: str):
+        """
+        Record that the file has all metadata. Has to be called after the file was saved and moved.
+        Not available for a read only manifest.
+
+        Args:
+            file_path (str): The path to the audio file.
+        """
+        key = self._key(file_path)
+        if key is None:
+            return
+        self._shelf[key] = True
+        self._unsynced += 1
+        if self._unsynced >= self._sync_every:
+            self._shelf.sync()
+            self._unsynced = 0
+
+    def close(self):
+        if self._shelf is not None:
+            self._shelf.close()
+
+def move_file(source_path: str, dest_path: str) -> bool:
     """
     Move a file to the destination path.
+
+    Returns:
+        bool: True if the file is located at the destination path afterward.
     """
     if not valid_file_path(source_path):
         log(LogLevel.ERROR, f"Move source does not exists: {source_path}")
-        return
+        return False
 
     if os.path.abspath(source_path) == os.path.abspath(dest_path):
         log(LogLevel.INFO, f"Move source and destination paths are equal: {source_path} == {dest_path}")
-        return
+        return True
 
     if os.path.exists(dest_path):
         log(LogLevel.WARN, f"Destination path already exists: {dest_path}")
         log(LogLevel.WARN, f"File will be overwritten!")
 
     shutil.move(source_path, dest_path)
-    log(LogLevel.FINE, f"Successfully moved file to {os.path.dirname(dest_path)}.")
+    if log_enabled(LogLevel.FINE):
+        log(LogLevel.FINE, f"Successfully moved file to {os.path.dirname(dest_path)}.")
+    return True
 
 class LogLevel(Enum):
-    SUCCESS = 0
-    FINE = 1
-    INFO = 2
+    # Ordered by importance, messages below the minimum log level are not printed.
+    FINE = 0
+    INFO = 1
+    SUCCESS = 2
     WARN = 3
     ERROR = 4
-    
+
+_LOG_PREFIX = {
+    LogLevel.SUCCESS: "✅ ",
+    LogLevel.FINE: "💬 ",
+    LogLevel.INFO: "ℹ️ ",
+    LogLevel.WARN: "⚠️ ",
+    LogLevel.ERROR: "❌ ",
+}
+
+# The minimum log level can be set with the AUDIO_METADATA_LOG environment variable, e.g. AUDIO_METADATA_LOG=WARN.
+_MIN_LOG_LEVEL = LogLevel.__members__.get(os.environ.get("AUDIO_METADATA_LOG", "").upper(), LogLevel.FINE).value
+
+def log_enabled(level: LogLevel) -> bool:
+    """
+    Check if messages of the log level are printed.
+    Used to skip formatting log messages, which would be dropped anyway.
+
+    Args:
+        level (LogLevel): The log level to check.
+    Returns:
+        bool: True if messages of the log level are printed.
+    """
+    return level.value >= _MIN_LOG_LEVEL
+
 def log(level: LogLevel, message: str):
-    match level:
-        case LogLevel.SUCCESS:
-            print(f"✅ {message}")
-        case LogLevel.FINE:
-            print(f"💬 {message}")
-        case LogLevel.INFO:
-            print(f"ℹ️ {message}")
-        case LogLevel.WARN:
-            print(f"⚠️ {message}")
-        case LogLevel.ERROR:
-            print(f"❌ {message}")
\ No newline at end of file
+    if not log_enabled(level):
+        return
+    print(_LOG_PREFIX[level] + message)
@@ -1,7 +1,8 @@
 import os
+import atexit
 import argparse
+import functools
 import shutil
-from mutagen.mp3 import MP3
 from mutagen.mp4 import MP4, MP4Cover
 from mutagen.id3 import ID3, APIC
 from tkinter import Tk, filedialog
@@ -13,6 +14,23 @@ class ImgFileExtension(Enum):
     NOT_SUPPORTED = 0
     SUPPORTED = 1
 
+_tk_root = None
+
+def _get_tk_root() -> Tk:
+    """
+    Get the hidden Tk root window, used as parent of the file dialogs.
+    It is created on first use and reused afterward, so Tcl/Tk is only started once.
+
+    Returns:
+        Tk: The hidden Tk root window.
+    """
+    global _tk_root
+    if _tk_root is None:
+        _tk_root = Tk()
+        _tk_root.withdraw()
+        atexit.register(_tk_root.destroy)
+    return _tk_root
+
 def get_img_file_extension(img_path: str) -> ImgFileExtension:
     """
     Get the image file extension of the given file.
@@ -25,7 +43,7 @@ def get_img_file_extension(img_path: str) -> ImgFileExtension:
     if not cm.valid_file_path(img_path):
         return ImgFileExtension.NOT_SUPPORTED
 
-    ext = os.path.splitext(img_path)[1].lower()
+    ext = cm.split_extension(img_path)[1]
     if ext in [".jpg", ".jpeg", ".png"]:
         return ImgFileExtension.SUPPORTED
     else:
@@ -33,34 +51,93 @@ def get_img_file_extension(img_path: str) -> ImgFileExtension:
         return ImgFileExtension.NOT_SUPPORTED
 
 
-def has_cover(audio_path: str) -> bool:
+def _has_cover_mp3(audio: ID3) -> bool:
+    if audio.getall("APIC"):
+        return True
+    cm.log(cm.LogLevel.FINE, f"No cover image found.")
+    return False
+
+def _has_cover_m4a(audio: MP4) -> bool:
+    if audio.tags and "covr" in audio.tags and len(audio.tags["covr"]) > 0:
+        return True
+    cm.log(cm.LogLevel.FINE, f"No cover image found.")
+    return False
+
+# Magic bytes at the start of the supported image files, with their mime type and mp4 image format.
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png", MP4Cover.FORMAT_PNG),
+    (b"\xff\xd8\xff", "image/jpeg", MP4Cover.FORMAT_JPEG),
+)
+
+@functools.lru_cache(maxsize=32)
+def _read_cover(cover_path: str, mtime_ns: int, size: int) -> tuple[bytes, str, int]:
+    """
+    Read the cover image and detect its type from the first bytes.
+    The result is cached, since the same cover is often added to all tracks of an album.
+    The modification time and size are part of the cache key, so a changed file is read again.
+
+    Args:
+        cover_path (str): The path to the cover image.
+        mtime_ns (int): The modification time of the cover image in nanoseconds.
+        size (int): The size of the cover image in bytes.
+    Returns:
+        tuple[bytes, str, int]: The content, the mime type and the mp4 image format of the cover image.
+        Unknown image types are treated as jpeg.
+    """
+    with open(cover_path, "rb") as img:
+        data = img.read()
+    for signature, mime, mp4_format in _IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return data, mime, mp4_format
+    return data, "image/jpeg", MP4Cover.FORMAT_JPEG
+
+def _set_cover_mp3(audio: ID3, data: bytes, mime: str, mp4_format: int):
+    if "APIC" in audio:
+        audio.delall("APIC")
+    audio.add(APIC(encoding=3, mime=mime, type=3, desc='Cover', data=data))
+
+def _set_cover_m4a(audio: MP4, data: bytes, mime: str, mp4_format: int):
+    audio["covr"] = [MP4Cover(data, imageformat=mp4_format)]
+
+_HAS_COVER = {
+    cm.AudioFileExtension.MP3: _has_cover_mp3,
+    cm.AudioFileExtension.M4A: _has_cover_m4a,
+}
+_SET_COVER = {
+    cm.AudioFileExtension.MP3: _set_cover_mp3,
+    cm.AudioFileExtension.M4A: _set_cover_m4a,
+}
+
+def _cover_in_tags(ext: cm.AudioFileExtension, audio: ID3 | MP4) -> bool:
+    """
+    Check if the already opened audio file has a cover image.
+
+    Args:
+        ext (AudioFileExtension): The enum type of the file extension.
+        audio (ID3 | MP4): The opened audio file.
+    Returns:
+        bool: True if the file has a cover image, False otherwise.
+    """
+    has_cover_of_format = _HAS_COVER.get(ext)
+    return has_cover_of_format is not None and has_cover_of_format(audio)
+
+def has_cover(audio_path: str, audio: ID3 | MP4=None) -> bool:
     """
     Check if the audio file has already a cover image.
 
     Args:
         audio_path (str): The path to the file, to check if the cover image is already present.
+        audio (ID3 | MP4, optional): The already opened audio file. If not set the file will be opened.
     Returns:
         bool: True if the file has a cover image, False otherwise.
     """
-    ext = cm.get_audio_file_extension(audio_path)
-
-    match ext:
-        case cm.AudioFileExtension.NOT_SUPPORTED:
-            return False
-        case cm.AudioFileExtension.MP3:
-            audio = MP3(audio_path)
-            if audio.tags:
-                for tag in audio.tags.values():
-                    if tag.FrameID == "APIC":
-                        return True
-            cm.log(cm.LogLevel.FINE, f"No cover image found.")
-            return False
-        case cm.AudioFileExtension.M4A:
-            audio = MP4(audio_path)
-            if "covr" in audio.tags and len(audio.tags["covr"]) > 0:
-                return True
-            cm.log(cm.LogLevel.FINE, f"No cover image found.")
+    if audio is None:
+        ext, audio = cm.open_audio(audio_path)
+        if audio is None:
             return False
+    else:
+        ext = cm.get_audio_file_extension(audio_path)
+    return _cover_in_tags(ext, audio)
     
 def select_cover(cover_dir_path: str) -> str | None:
     """
@@ -75,14 +152,12 @@ def select_cover(cover_dir_path: str) -> str | None:
     if not cm.valid_dir_path(cover_dir_path):
         return None
 
-    root = Tk()
-    root.withdraw()
     cover_path = filedialog.askopenfilename(
+        parent=_get_tk_root(),
         title="Select Cover Image",
         initialdir=cover_dir_path,
         filetypes=[("Image Files", "*.jpg *.jpeg *.png")]
     )
-    root.destroy()
     if not cover_path:
         cm.log(cm.LogLevel.FINE, "No cover image selected.")
         return None
@@ -92,7 +167,7 @@ def select_cover(cover_dir_path: str) -> str | None:
         
     return cover_path
 
-def add_cover(audio_path: str, cover_path: str, used_dir_path: str=None):
+def add_cover(audio_path: str, cover_path: str, used_dir_path: str=None, audio: ID3 | MP4=None):
     """
     Add the cover image to the audio file. If it does not have a cover image already.
 
@@ -100,6 +175,8 @@ def add_cover(audio_path: str, cover_path: str, used_dir_path: str=None):
         audio_path (str): The path to the file, to add the cover image.
         cover_path (str): The path to the cover image.
         used_dir_path (str, optional): The path to the "used" directory. If set the cover image will be moved there.
+        audio (ID3 | MP4, optional): The already opened audio file. If set the cover image is only added to its tags,
+        saving the file is then up to the caller.
     """
     if used_dir_path and not cm.valid_dir_path(used_dir_path):
         return
@@ -108,29 +185,25 @@ def add_cover(audio_path: str, cover_path: str, used_dir_path: str=None):
     if img_ext == ImgFileExtension.NOT_SUPPORTED:
         return
 
-    if has_cover(audio_path):
+    save = audio is None
+    if audio is None:
+        audio_ext, audio = cm.open_audio(audio_path)
+        if audio is None:
+            return
+    else:
+        audio_ext = cm.get_audio_file_extension(audio_path)
+
+    if _cover_in_tags(audio_ext, audio):
         cm.log(cm.LogLevel.FINE, f"Has already a cover image.")
         return
 
-    audio_ext = cm.get_audio_file_extension(audio_path)
-    match audio_ext:
-        case cm.AudioFileExtension.NOT_SUPPORTED:
-            return
-        case cm.AudioFileExtension.MP3:
-            audio = MP3(audio_path, ID3=ID3)
-            if audio.tags is None:
-                audio.add_tags()
-            if "APIC" in audio.tags:
-                audio.tags.delall("APIC")
-            with open(cover_path, "rb") as img:
-                audio.tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=img.read()))
-            audio.save(v2_version=3)
-        case cm.AudioFileExtension.M4A:
-            audio = MP4(audio_path)
-            with open(cover_path, "rb") as img:
-                audio["covr"] = [MP4Cover(img.read(), imageformat=MP4Cover.FORMAT_JPEG)]
-            audio.save()
-    cm.log(cm.LogLevel.SUCCESS, f"Successfully added cover to {audio_path}.")
+    cover_stat = os.stat(cover_path)
+    _SET_COVER[audio_ext](audio, *_read_cover(cover_path, cover_stat.st_mtime_ns, cover_stat.st_size))
+
+    if save:
+        cm.save_audio(audio)
+    if cm.log_enabled(cm.LogLevel.SUCCESS):
+        cm.log(cm.LogLevel.SUCCESS, f"Successfully added cover to {audio_path}.")
 
     # Optional: Move cover_path to used_dir only if it is not already there.
     if used_dir_path:
@@ -147,7 +220,8 @@ def add_cover(audio_path: str, cover_path: str, used_dir_path: str=None):
             return
 
         shutil.move(cover_path, dest_path)
-        cm.log(cm.LogLevel.FINE, f"Successfully moved cover to {used_dir_path}.")
+        if cm.log_enabled(cm.LogLevel.FINE):
+            cm.log(cm.LogLevel.FINE, f"Successfully moved cover to {used_dir_path}.")
 
 def add_cover_all(dir_path: str, cover_dir_path: str, used_dir_path: str=None):
     """
@@ -161,13 +235,14 @@ def add_cover_all(dir_path: str, cover_dir_path: str, used_dir_path: str=None):
     if used_dir_path and not cm.valid_dir_path(used_dir_path):
         return
 
-    if not cm.valid_dir_path(dir_path) and not cm.valid_dir_path(cover_dir_path):
+    if not cm.valid_dir_path(dir_path) or not cm.valid_dir_path(cover_dir_path):
         return
 
-    for root, _, files in os.walk(root_dir):
-        for file in files:
-            print(f"Adding cover image to {file}.")
-            audio_path = str(os.path.join(root, file))
+    with cm.Manifest(read_only=True) as manifest:
+        for audio_path in cm.iter_audio_files(dir_path):
+            if manifest.is_complete(audio_path):
+                continue
+            print(f"Adding cover image to {os.path.basename(audio_path)}.")
             cover_path = select_cover(cover_dir_path)
             if cover_path:
                 add_cover(audio_path, cover_path, used_dir_path)
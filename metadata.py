@@ -2,7 +2,6 @@ import os
 import sys
 import shutil
 import argparse
-from mutagen.mp3 import MP3
 from mutagen.mp4 import MP4, MP4Cover
 from mutagen.id3 import ID3, TIT2, TPE1, TALB, TRCK, TCON, TYER, TPE2, TPOS
 from enum import Enum
@@ -25,6 +24,37 @@ class MetadataFlags(Enum):
     HAS_COVER = 0x0100
     HAS_BPM = 0x0200
 
+# All flags set, the audio file has all metadata.
+ALL_METADATA = sum(flag.value for flag in MetadataFlags)
+
+# Maps the tag keys of the formats to the flag, which is set when the tag is present.
+_MP3_TAG_FLAGS = {
+    "TIT2": MetadataFlags.HAS_TITLE.value,
+    "TPE1": MetadataFlags.HAS_ARTIST.value,
+    "TALB": MetadataFlags.HAS_ALBUM.value,
+    "TPE2": MetadataFlags.HAS_ALBUM_ARTIST.value,
+    "TRCK": MetadataFlags.HAS_TRACK_NUMBER.value,
+    "TPOS": MetadataFlags.HAS_DISC_NUMBER.value,
+    "TCON": MetadataFlags.HAS_GENRE.value,
+    "TYER": MetadataFlags.HAS_YEAR.value,
+    # mutagen loads TYER as the ID3v2.4 frame TDRC, TYER is only present before the file is saved and loaded again.
+    "TDRC": MetadataFlags.HAS_YEAR.value,
+}
+_M4A_TAG_FLAGS = {
+    "\xa9nam": MetadataFlags.HAS_TITLE.value,
+    "\xa9ART": MetadataFlags.HAS_ARTIST.value,
+    "\xa9alb": MetadataFlags.HAS_ALBUM.value,
+    "aART": MetadataFlags.HAS_ALBUM_ARTIST.value,
+    "trkn": MetadataFlags.HAS_TRACK_NUMBER.value,
+    "disk": MetadataFlags.HAS_DISC_NUMBER.value,
+    "\xa9gen": MetadataFlags.HAS_GENRE.value,
+    "\xa9day": MetadataFlags.HAS_YEAR.value,
+}
+_TAG_FLAGS = {
+    cm.AudioFileExtension.MP3: _MP3_TAG_FLAGS,
+    cm.AudioFileExtension.M4A: _M4A_TAG_FLAGS,
+}
+
 def parse_filename(filename: str) -> tuple[str, str] | None:
     """
     Extract artist and title from filename like 'Avicii - Levels.m4a'.
@@ -34,7 +64,7 @@ def parse_filename(filename: str) -> tuple[str, str] | None:
     Returns:
         tuple[str, str]: Artist and title based on filename.
     """
-    base = os.path.splitext(filename)[0]
+    base = cm.split_extension(filename)[0]
     parts = base.split(" - ", 1)
     if len(parts) < 2:
         cm.log(cm.LogLevel.WARN, f"Invalid filename: {filename}")
@@ -45,94 +75,127 @@ def parse_filename(filename: str) -> tuple[str, str] | None:
 def is_missing(metadata_flags: int, flag_to_check: MetadataFlags) -> bool:
     return (metadata_flags & flag_to_check.value) == MetadataFlags.NONE.value
     
-def get_track_nr(audio_path: str) -> int | None:
-    ext = cm.get_audio_file_extension(audio_path)
-    
-    match ext:
-        case cm.AudioFileExtension.NOT_SUPPORTED:
+def _track_nr_mp3(audio: ID3) -> int:
+    if "TRCK" in audio:
+        return int(audio["TRCK"].text[0].split("/")[0])
+    # No track tags currently exist
+    return 1
+
+def _track_nr_m4a(audio: MP4) -> int:
+    return audio.tags["trkn"][0][0]
+
+_TRACK_NR = {
+    cm.AudioFileExtension.MP3: _track_nr_mp3,
+    cm.AudioFileExtension.M4A: _track_nr_m4a,
+}
+
+def get_track_nr(audio_path: str, audio: ID3 | MP4=None) -> int | None:
+    if audio is None:
+        ext, audio = cm.open_audio(audio_path)
+        if audio is None:
             return None
-        case cm.AudioFileExtension.MP3:
-            try:
-            
-                audio = MP3(audio_path, ID3=ID3)
-                if audio.tags and "TRCK" in audio.tags:
-                    return int(audio.tags["TRCK"].text[0].split("/")[0])
-                else:
-                    # No track tags currently exist
-                    return 1
-            except (TypeError, ValueError):
-                cm.log(cm.LogLevel.ERROR, f"Failed to read track number of {audio_path}")
-                return None
-                
-        case cm.AudioFileExtension.M4A:
-            audio = MP4(audio_path)
-            return audio.tags["trkn"][0][0]
-
-def check_metadata(audio_path: str) -> int:
+    else:
+        ext = cm.get_audio_file_extension(audio_path)
+
+    try:
+        return _TRACK_NR[ext](audio)
+    except (TypeError, ValueError):
+        cm.log(cm.LogLevel.ERROR, f"Failed to read track number of {audio_path}")
+        return None
+
+def check_metadata(audio_path: str, audio: ID3 | MP4=None) -> int:
     """
     Checks which metadata is set of an audio file.
 
     Args:
         audio_path (str): The path to the audio file.
+        audio (ID3 | MP4, optional): The already opened audio file. If not set the file will be opened.
     Returns:
         int: The numerical value constructed out of the MetadataFlags enum.
         Each bit set stands for an already existing metadata.
         If something went wrong returns -1.
     """
-    ext = cm.get_audio_file_extension(audio_path)
+    if audio is None:
+        ext, audio = cm.open_audio(audio_path)
+        if audio is None:
+            return -1
+    else:
+        ext = cm.get_audio_file_extension(audio_path)
 
     res = MetadataFlags.NONE.value
-    match ext:
-        case cm.AudioFileExtension.NOT_SUPPORTED:
-            return -1
-        case cm.AudioFileExtension.MP3:
-            audio = MP3(audio_path, ID3=ID3)
-            if audio.tags is None:
-                return res
-            if "TIT2" in audio.tags:
-                res |= MetadataFlags.HAS_TITLE.value
-            if "TPE1" in audio.tags:
-                res |= MetadataFlags.HAS_ARTIST.value
-            if "TALB" in audio.tags:
-                res |= MetadataFlags.HAS_ALBUM.value
-            if "TPE2" in audio.tags:
-                res |= MetadataFlags.HAS_ALBUM_ARTIST.value
-            if "TRCK" in audio.tags:
-                res |= MetadataFlags.HAS_TRACK_NUMBER.value
-            if "TPOS" in audio.tags:
-                res |= MetadataFlags.HAS_DISC_NUMBER.value
-            if "TCON" in audio.tags:
-                res |= MetadataFlags.HAS_GENRE.value
-            if "TYER" in audio.tags:
-                res |= MetadataFlags.HAS_YEAR.value
-
-        case cm.AudioFileExtension.M4A:
-            audio = MP4(audio_path)
-            if audio.tags is None:
-                return res
-            if "\xa9nam" in audio.tags:
-                res |= MetadataFlags.HAS_TITLE.value
-            if "\xa9ART" in audio.tags:
-                res |= MetadataFlags.HAS_ARTIST.value
-            if "\xa9alb" in audio.tags:
-                res |= MetadataFlags.HAS_ALBUM.value
-            if "aART" in audio.tags:
-                res |= MetadataFlags.HAS_ALBUM_ARTIST.value
-            if "trkn" in audio.tags:
-                res |= MetadataFlags.HAS_TRACK_NUMBER.value
-            if "disk" in audio.tags:
-                res |= MetadataFlags.HAS_DISC_NUMBER.value
-            if "\xa9gen" in audio.tags:
-                res |= MetadataFlags.HAS_GENRE.value
-            if "\xa9day" in audio.tags:
-                res |= MetadataFlags.HAS_YEAR.value
-
-    if cover.has_cover(audio_path):
+    tags = cm.get_tags(audio)
+    if tags is None:
+        return res
+
+    tag_flags = _TAG_FLAGS[ext]
+    for key in tag_flags.keys() & tags.keys():
+        res |= tag_flags[key]
+
+    if cover.has_cover(audio_path, audio):
         res |= MetadataFlags.HAS_COVER.value
-    if bpm.has_bpm(audio_path):
+    if bpm.has_bpm(audio_path, audio):
         res |= MetadataFlags.HAS_BPM.value
     return res
 
+def _set_basic_metadata_mp3(audio: ID3,
+                            title: str | None,
+                            artist: str | None,
+                            album: str | None,
+                            album_artist: str | None,
+                            track_nr: int | None,
+                            disc_nr: int | None,
+                            genre: str | None,
+                            year: int | None):
+    if title:
+        audio.delall("TIT2")
+        audio.add(TIT2(encoding=3, text=title))
+    if artist:
+        audio.delall("TPE1")
+        audio.add(TPE1(encoding=3, text=artist))
+    if album:
+        audio.delall("TALB")
+        audio.add(TALB(encoding=3, text=album))
+    if album_artist:
+        audio.delall("TPE2")
+        audio.add(TPE2(encoding=3, text=album_artist))
+    if track_nr:
+        audio.delall("TRCK")
+        audio.add(TRCK(encoding=3, text=track_nr))
+    if disc_nr:
+        audio.delall("TPOS")
+        audio.add(TPOS(encoding=3, text=disc_nr))
+    if genre:
+        audio.delall("TCON")
+        audio.add(TCON(encoding=3, text=genre))
+    if year:
+        audio.delall("TYER")
+        audio.add(TYER(encoding=3, text=year))
+
+def _set_basic_metadata_m4a(audio: MP4,
+                            title: str | None,
+                            artist: str | None,
+                            album: str | None,
+                            album_artist: str | None,
+                            track_nr: int | None,
+                            disc_nr: int | None,
+                            genre: str | None,
+                            year: int | None):
+    if audio.tags is None:
+        audio.add_tags()
+    if title: audio["\xa9nam"] = title
+    if artist: audio["\xa9ART"] = artist
+    if album: audio["\xa9alb"] = album
+    if album_artist: audio["aART"] = album_artist
+    if track_nr: audio["trkn"] = [(track_nr, 0)]
+    if disc_nr: audio["disk"] = [(disc_nr, 0)]
+    if genre: audio["\xa9gen"] = genre
+    if year: audio["\xa9day"] = year
+
+_SET_BASIC_METADATA = {
+    cm.AudioFileExtension.MP3: _set_basic_metadata_mp3,
+    cm.AudioFileExtension.M4A: _set_basic_metadata_m4a,
+}
+
 def set_basic_metadata(audio_path: str,
                        title: str=None,
                        artist: str=None,
@@ -141,7 +204,8 @@ def set_basic_metadata(audio_path: str,
                        track_nr: int=None,
                        disc_nr: int=None,
                        genre: str=None,
-                       year: int=None):
+                       year: int=None,
+                       audio: ID3 | MP4=None):
     """
     Sets the basic metadata to the audio file.
 
@@ -155,60 +219,40 @@ def set_basic_metadata(audio_path: str,
         disc_nr (str, optional): The disc number of the audio.
         genre (str, optional): The genre of the audio.
         year (str, optional): The release year of the audio.
+        audio (ID3 | MP4, optional): The already opened audio file. If set the metadata is only set to its tags,
+        saving the file is then up to the caller.
     """
-    ext = cm.get_audio_file_extension(audio_path)
-
-    match ext:
-        case cm.AudioFileExtension.NOT_SUPPORTED:
+    save = audio is None
+    if audio is None:
+        ext, audio = cm.open_audio(audio_path)
+        if audio is None:
             return
-        case cm.AudioFileExtension.MP3:
-            audio = MP3(audio_path, ID3=ID3)
-            if audio.tags is None:
-                audio.add_tags()
-            if title:
-                audio.tags.delall("TIT2")
-                audio.tags.add(TIT2(encoding=3, text=title))
-            if artist:
-                audio.tags.delall("TPE1")
-                audio.tags.add(TPE1(encoding=3, text=artist))
-            if album:
-                audio.tags.delall("TALB")
-                audio.tags.add(TALB(encoding=3, text=album))
-            if album_artist:
-                audio.tags.delall("TPE2")
-                audio.tags.add(TPE2(encoding=3, text=album_artist))
-            if track_nr:
-                audio.tags.delall("TRCK")
-                audio.tags.add(TRCK(encoding=3, text=track_nr))
-            if disc_nr:
-                audio.tags.delall("TPOS")
-                audio.tags.add(TPOS(encoding=3, text=disc_nr))
-            if genre:
-                audio.tags.delall("TCON")
-                audio.tags.add(TCON(encoding=3, text=genre))
-            if year:
-                audio.tags.delall("TYER")
-                audio.tags.add(TYER(encoding=3, text=year))
-            audio.save()
-
-        case cm.AudioFileExtension.M4A:
-            audio = MP4(audio_path)
-            if audio.tags is None:
-                audio.add_tags()
-            if title: audio["\xa9nam"] = title
-            if artist: audio["\xa9ART"] = artist
-            if album: audio["\xa9alb"] = album
-            if album_artist: audio["aART"] = album_artist
-            if track_nr: audio["trkn"] = [(track_nr, 0)]
-            if disc_nr: audio["disk"] = [(disc_nr, 0)]
-            if genre: audio["\xa9gen"] = genre
-            if year: audio["\xa9day"] = year
-            audio.save()
+    else:
+        ext = cm.get_audio_file_extension(audio_path)
+
+    _SET_BASIC_METADATA[ext](audio, title, artist, album, album_artist, track_nr, disc_nr, genre, year)
+
+    if save:
+        cm.save_audio(audio)
+
+def _move_to_dir(audio_path: str, move_to_dir_path: str) -> str:
+    """
+    Move the audio file into the directory.
+
+    Args:
+        audio_path (str): Path to the audio file.
+        move_to_dir_path (str): Path to the directory where the audio will be moved to.
+    Returns:
+        str: The path to the audio file afterward, the old path if it could not be moved.
+    """
+    dest_path = os.path.join(move_to_dir_path, os.path.basename(audio_path))
+    return dest_path if cm.move_file(audio_path, dest_path) else audio_path
 
 def add_metadata(audio_path: str,
                  cover_dir_path: str,
                  used_dir_path: str=None,
-                 move_to_dir_path: str=None) -> bool:
+                 move_to_dir_path: str=None,
+                 manifest: cm.Manifest=None) -> bool:
     """
     Adds metadata to the provided audio file.
     If a tag is missing it asks the user to add it.
@@ -220,14 +264,25 @@ def add_metadata(audio_path: str,
         Defines the directory where the selected cover will be moved to.
         move_to_dir_path (str, optional): Path to the directory where the audio will be moved to.
         If no directory was provided the file will not be moved.
+        manifest (Manifest, optional): The manifest of complete files. If set complete files are skipped
+        and files, which are complete afterward, are recorded.
     Return:
         bool: False if a key interrupt was caught during input fetching.
         True when more audio file can be edited.
     """
-    metadata_flags = check_metadata(audio_path)
-    if metadata_flags < 0:
+    if manifest and manifest.is_complete(audio_path):
+        cm.log(cm.LogLevel.FINE, "Has already all metadata.")
+        if move_to_dir_path and cm.valid_dir_path(move_to_dir_path):
+            manifest.mark_complete(_move_to_dir(audio_path, move_to_dir_path))
+        return True
+
+    # The file is opened once, all changes are applied to it in memory and saved at the end.
+    _, audio = cm.open_audio(audio_path)
+    if audio is None:
         return True # Either path does not exist, is not a file or is not supported.
 
+    metadata_flags = check_metadata(audio_path, audio)
+
     if used_dir_path and not cm.valid_dir_path(used_dir_path):
         return True # Provided used dir path is not valid.
 
@@ -257,7 +312,7 @@ def add_metadata(audio_path: str,
         
         default_track_nr = 1
         if not is_missing(metadata_flags, MetadataFlags.HAS_TRACK_NUMBER):
-            raw = get_track_nr(audio_path)
+            raw = get_track_nr(audio_path, audio)
             if raw:
                 default_track_nr = raw
         if album != default_album or default_track_nr != 1:
@@ -280,19 +335,26 @@ def add_metadata(audio_path: str,
             return False
 
     # Set all the basic metadata
-    set_basic_metadata(audio_path, title, artist, album, album_artist, track_nr, 1, genre, year)
+    set_basic_metadata(audio_path, title, artist, album, album_artist, track_nr, 1, genre, year, audio=audio)
 
     if is_missing(metadata_flags, MetadataFlags.HAS_COVER):
         cover_path = cover.select_cover(cover_dir_path)
         if cover_path:
-            cover.add_cover(audio_path, cover_path, used_dir_path)
+            cover.add_cover(audio_path, cover_path, used_dir_path, audio=audio)
 
     if is_missing(metadata_flags, MetadataFlags.HAS_BPM):
-        bpm.add_bpm(audio_path)
+        bpm.add_bpm(audio_path, audio=audio)
+
+    cm.save_audio(audio)
+    complete = manifest is not None and check_metadata(audio_path, audio) == ALL_METADATA
 
     # Optional move...
     if move_to_dir_path:
-        cm.move_file(audio_path, os.path.join(move_to_dir_path, os.path.basename(audio_path)))
+        audio_path = _move_to_dir(audio_path, move_to_dir_path)
+
+    # Recorded after the move, since the entries are keyed on the path.
+    if complete:
+        manifest.mark_complete(audio_path)
 
     return True
 
@@ -319,22 +381,27 @@ def add_metadata_all(audio_dir_path: str,
     if move_to_dir_path and not cm.valid_dir_path(move_to_dir_path):
         return
 
-    files = [f for f in os.listdir(audio_dir_path)
-             if os.path.isfile(os.path.join(audio_dir_path, f))]
+    # Start each run with an empty cache, so it does not grow over several runs.
+    cm.get_audio_file_extension.cache_clear()
+
+    # Collected up front, since processed files might be moved out of the directory.
+    files = list(cm.iter_audio_files(audio_dir_path, recursive=False))
 
     if not files:
         cm.log(cm.LogLevel.INFO, f"No audio files found in {audio_dir_path}")
         return
+    cm.log(cm.LogLevel.INFO, f"{len(files)} audio files found in {audio_dir_path}")
 
     cm.log(cm.LogLevel.INFO, "Press Ctr+C to exit.\n")
 
-    for file in files:
-        file_path = os.path.join(audio_dir_path, file)
-        cm.log(cm.LogLevel.INFO, f"Processing: {file}")
+    with cm.Manifest() as manifest:
+        for file_path in files:
+            if cm.log_enabled(cm.LogLevel.INFO):
+                cm.log(cm.LogLevel.INFO, f"Processing: {os.path.basename(file_path)}")
 
-        do_next = add_metadata(file_path, cover_dir_path, used_dir_path, move_to_dir_path)
-        if not do_next:
-            return # Exiting the main loop.
+            do_next = add_metadata(file_path, cover_dir_path, used_dir_path, move_to_dir_path, manifest)
+            if not do_next:
+                return # Exiting the main loop.
 
 if __name__ == "__main__":
     add_metadata_all("../../Playlists/Trap",
@@ -0,0 +1,25 @@
+"""
+Optional: compile the pure Python modules to C extensions with Cython, which removes the interpreter overhead
+of the per file checks and dispatch.
+
+    pip install cython
+    python setup.py build_ext --inplace
+
+The scripts work the same without compiling, the compiled modules are imported instead of the .py files when present.
+beat.py is not compiled, it is already compiled with numba.
+"""
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name="audio-metadata",
+    ext_modules=cythonize(
+        ["common.py", "bpm.py", "metadata.py"],
+        language_level=3,
+        compiler_directives={
+            "infer_types": True,
+            # Keep the Python semantics of the annotations, e.g. int parameters which are None when the tag exists.
+            "annotation_typing": False,
+        },
+    ),
+)
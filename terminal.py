@@ -1,68 +1,145 @@
-from enum import Enum
+import sys
+import functools
+from enum import IntEnum
+from typing import Any
+from collections.abc import Iterator
 
 import common as cm
 
-class TerminalResult(Enum):
+class TerminalResult(IntEnum):
+    """
+    Result of an ask_input_* function. The members are ints, so comparing them is a plain int comparison.
+    Note that EXIT (-1) is truthy as well, use result > 0 or result == TerminalResult.SUCCESS to check for SUCCESS.
+    """
     EXIT = -1
     FAILED = 0
     SUCCESS = 1
 
-def ask_input_str(prompt: str, default: str=None) -> tuple[TerminalResult, str | None]:
+# Results which do not depend on the input, returned as they are instead of building a new tuple on each call.
+_EXIT_NONE = (TerminalResult.EXIT, None)
+_EXIT_FALSE = (TerminalResult.EXIT, False)
+_FAILED_NONE = (TerminalResult.FAILED, None)
+_FAILED_ZERO = (TerminalResult.FAILED, 0)
+_FAILED_FALSE = (TerminalResult.FAILED, False)
+_BOOL_TRUE = (TerminalResult.SUCCESS, True)
+_BOOL_FALSE = (TerminalResult.SUCCESS, False)
+
+# Piped input is read line by line from the buffered stdin instead of input(), which is meant for terminals.
+_STDIN_PIPED = sys.stdin is not None and not sys.stdin.isatty()
+
+@functools.lru_cache(maxsize=128)
+def _format_prompt(prompt: str, default: str | None) -> str:
+    return f"{prompt} [{'default: ' + default if default else ''}]: "
+
+@functools.lru_cache(maxsize=128)
+def _format_bool_prompt(prompt: str) -> str:
+    return f"{prompt} [y/n]: "
+
+def _read_line(prompt: str) -> tuple[bool, str]:
     """
-    Ask user input for string value with optional default value.
+    Read one line of user input. Handles the keyboard interrupt for all ask_input_* functions.
+    Piped input is read from the buffered sys.stdin directly, the end of the input is handled like an interrupt.
 
     Args:
-        prompt (str): The prompt to be displayed.
-        default (str, optional): The default value to be displayed.
+        prompt (str): The formatted prompt to be displayed.
     Returns:
-        tuple[TerminalResult, str | None]: A tuple with the terminal result and the input value.
-        If an inconsistent state or a keyboard interrupt occurs, the return value is None.
+        tuple[bool, str]: True and the input value without trailing whitespace, leading whitespace is kept,
+        or False and an empty string if the user interrupted the input or the input ended.
     """
     try:
-        val = input(f"{prompt} [{'default: ' + default if default else ''}]: ").strip()
+        if not _STDIN_PIPED:
+            return True, input(prompt).rstrip()
+
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
+        line = sys.stdin.readline()
     except KeyboardInterrupt:
-        cm.log(cm.LogLevel.INFO, f"Keyboard interrupt, exiting.")
-        return TerminalResult.EXIT, None
+        cm.log(cm.LogLevel.INFO, "Keyboard interrupt, exiting.")
+        return False, ""
+    except EOFError:
+        # Ctrl+D (Ctrl+Z on Windows) in a terminal.
+        cm.log(cm.LogLevel.INFO, "End of input, exiting.")
+        return False, ""
+
+    if not line:
+        cm.log(cm.LogLevel.INFO, "End of input, exiting.")
+        return False, ""
+    return True, line.rstrip()
+
+def _parse_str(val: str, default: str=None) -> tuple[TerminalResult, str | None]:
     if not val and not default:
-        cm.log(cm.LogLevel.ERROR, f"No value and no default provided!")
-        return TerminalResult.FAILED, None
+        cm.log(cm.LogLevel.ERROR, "No value and no default provided!")
+        return _FAILED_NONE
 
     if not val and default:
         return TerminalResult.SUCCESS, default
     return TerminalResult.SUCCESS, val
 
-def ask_input_int(prompt: str, default: int=None) -> tuple[TerminalResult, int]:
-    """
-    Ask user input for integer value with optional default value.
-
-    Args:
-        prompt (str): The prompt to be displayed.
-        default (int, optional): The default value to be displayed. Default is None.
-    Returns:
-        tuple[TerminalResult, int]: A tuple with the terminal result and the input value.
-    """
-    try:
-        val = input(f"{prompt} [{'default: ' + str(default) if default else ''}]: ").strip()
-    except KeyboardInterrupt:
-        cm.log(cm.LogLevel.INFO, f"Keyboard interrupt, exiting.")
-        return TerminalResult.EXIT, default
-        
+def _parse_int(val: str, default: int=None) -> tuple[TerminalResult, int]:
     try:
-        if val.strip() == "":
+        if not val:
             if default:
                 int_val = default
             else:
-                cm.log(cm.LogLevel.WARN, f"No integer value was provided and no default.")
-                return TerminalResult.FAILED, 0
+                cm.log(cm.LogLevel.WARN, "No integer value was provided and no default.")
+                return _FAILED_ZERO
         else:
             int_val = int(val)
             
     except (ValueError, TypeError):
-        cm.log(cm.LogLevel.ERROR, f"Invalid integer provided!")
-        return TerminalResult.FAILED, default
+        cm.log(cm.LogLevel.ERROR, "Invalid integer provided!")
+        return _FAILED_NONE if default is None else (TerminalResult.FAILED, default)
 
     return TerminalResult.SUCCESS, int_val
 
+def _parse_bool(val: str, default: bool=False) -> tuple[TerminalResult, bool]:
+    if not val:
+        if default is True:
+            return _BOOL_TRUE
+        return _BOOL_FALSE if default is False else (TerminalResult.SUCCESS, default)
+
+    # Accepted are y, yes, n and no in any case. Dispatched on the first character,
+    # so only the longer answers have to be lowercased for the comparison.
+    first = val[0]
+    if first in "yY" and (len(val) == 1 or val.lower() == "yes"):
+        return _BOOL_TRUE
+    if first in "nN" and (len(val) == 1 or val.lower() == "no"):
+        return _BOOL_FALSE
+
+    cm.log(cm.LogLevel.ERROR, "Invalid boolean value provided!")
+    return _FAILED_FALSE if default is False else (TerminalResult.FAILED, default)
+
+def ask_input_str(prompt: str, default: str=None) -> tuple[TerminalResult, str | None]:
+    """
+    Ask user input for string value with optional default value.
+
+    Args:
+        prompt (str): The prompt to be displayed.
+        default (str, optional): The default value to be displayed.
+    Returns:
+        tuple[TerminalResult, str | None]: A tuple with the terminal result and the input value.
+        If an inconsistent state or a keyboard interrupt occurs, the return value is None.
+    """
+    ok, val = _read_line(_format_prompt(prompt, default))
+    if not ok:
+        return _EXIT_NONE
+    return _parse_str(val, default)
+
+def ask_input_int(prompt: str, default: int=None) -> tuple[TerminalResult, int]:
+    """
+    Ask user input for integer value with optional default value.
+
+    Args:
+        prompt (str): The prompt to be displayed.
+        default (int, optional): The default value to be displayed. Default is None.
+    Returns:
+        tuple[TerminalResult, int]: A tuple with the terminal result and the input value.
+    """
+    ok, val = _read_line(_format_prompt(prompt, str(default) if default else None))
+    if not ok:
+        return _EXIT_NONE if default is None else (TerminalResult.EXIT, default)
+    return _parse_int(val, default)
+
 def ask_input_bool(prompt: str, default: bool=False) -> tuple[TerminalResult, bool]:
     """
     Ask user input for boolean value (y/n) with default value.
@@ -73,18 +150,52 @@ def ask_input_bool(prompt: str, default: bool=False) -> tuple[TerminalResult, bo
     Returns:
         tuple[TerminalResult, bool]: A tuple with the terminal result and the boolean value.
     """
-    try:
-        val = input(f"{prompt} [y/n]: ").strip().lower()
-    except KeyboardInterrupt:
-        cm.log(cm.LogLevel.INFO, f"Keyboard interrupt, exiting.")
-        return TerminalResult.EXIT, default
+    ok, val = _read_line(_format_bool_prompt(prompt))
+    if not ok:
+        return _EXIT_FALSE if default is False else (TerminalResult.EXIT, default)
+    return _parse_bool(val, default)
 
-    if val == "":
-        return TerminalResult.SUCCESS, default
-    elif val in ("y", "yes"):
-        return TerminalResult.SUCCESS, True
-    elif val in ("n", "no"):
-        return TerminalResult.SUCCESS, False
-    else:
-        cm.log(cm.LogLevel.ERROR, f"Invalid boolean value provided!")
-        return TerminalResult.FAILED, default
\ No newline at end of file
+_PARSERS = {str: _parse_str, int: _parse_int, bool: _parse_bool}
+_ASK_INPUTS = {str: ask_input_str, int: ask_input_int, bool: ask_input_bool}
+
+def stream_inputs(specs: list[tuple[str, type, Any]]) -> Iterator[tuple[TerminalResult, Any]]:
+    """
+    Ask user input for several values, yielding each result as soon as it is parsed.
+    When stdin is a terminal the user is prompted for each value in turn.
+    Otherwise stdin is read until its end at once, one line per value, and no prompts are displayed.
+    Values without a line, or after the user exited, are returned with TerminalResult.EXIT and their default value.
+
+    Args:
+        specs (list[tuple[str, type, Any]]): The prompt, type (str, int or bool) and default value of each value.
+    Returns:
+        Iterator[tuple[TerminalResult, Any]]: A tuple with the terminal result and the input value, for each spec.
+    """
+    if not _STDIN_PIPED:
+        exited = False
+        for prompt, value_type, default in specs:
+            if exited:
+                # Like at the end of piped input, nothing is asked after the user exited.
+                yield _EXIT_NONE if default is None else (TerminalResult.EXIT, default)
+                continue
+            result = _ASK_INPUTS[value_type](prompt, default)
+            exited = result[0] == TerminalResult.EXIT
+            yield result
+        return
+
+    lines = sys.stdin.read().splitlines()
+    for i, (_, value_type, default) in enumerate(specs):
+        if i >= len(lines):
+            yield _EXIT_NONE if default is None else (TerminalResult.EXIT, default)
+        else:
+            yield _PARSERS[value_type](lines[i].rstrip(), default)
+
+def ask_inputs(specs: list[tuple[str, type, Any]]) -> list[tuple[TerminalResult, Any]]:
+    """
+    Ask user input for several values, see stream_inputs.
+
+    Args:
+        specs (list[tuple[str, type, Any]]): The prompt, type (str, int or bool) and default value of each value.
+    Returns:
+        list[tuple[TerminalResult, Any]]: A tuple with the terminal result and the input value, for each spec.
+    """
+    return list(stream_inputs(specs))